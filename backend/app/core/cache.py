@@ -0,0 +1,47 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class AsyncTTLCache:
+    """
+    Caches coroutine results for a fixed amount of time.
+
+    Concurrent lookups for the same key share a single in-flight call instead of
+    each starting their own, and failed calls are not cached.
+    """
+
+    def __init__(self, ttl: float = 600, maxsize: int = 100):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[Hashable, tuple[float, asyncio.Future]] = {}
+
+    async def get_or_set(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        # No awaits between the lookup and the insert, so this is atomic on the event loop
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            future = entry[1]
+        else:
+            future = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda f: self._discard_failed(key, f))
+            self._evict()
+            self._entries[key] = (time.monotonic() + self.ttl, future)
+
+        # Shield so one caller disconnecting doesn't cancel the fetch for the others
+        return await asyncio.shield(future)
+
+    def _discard_failed(self, key: Hashable, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is None:
+            return
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is future:
+            del self._entries[key]
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) >= self.maxsize:
+            del self._entries[next(iter(self._entries))]
@@ -0,0 +1,9 @@
+import httpx
+
+# Shared client so requests to GitHub and Azure DevOps reuse pooled (HTTP/2) connections
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_connections=50),
+    follow_redirects=True,
+)
@@ -4,13 +4,21 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from app.routers import generate, modify
 from app.core.limiter import limiter
+from app.core.http_client import http_client
 from typing import cast
 from starlette.exceptions import ExceptionMiddleware
 from api_analytics.fastapi import Analytics
+from contextlib import asynccontextmanager
 import os
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = ["http://localhost:3000", "https://gitdiagram.com"]
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 from dotenv import load_dotenv
 from app.services.github_service import GitHubService
 from app.services.azure_service import AzureDevOpsService
 from app.services.o4_mini_openai_service import OpenAIo4Service
+from app.core.cache import AsyncTTLCache
 from app.prompts import (
     SYSTEM_FIRST_PROMPT,
     SYSTEM_SECOND_PROMPT,
@@ -12,26 +14,61 @@ from app.prompts import (
 )
 from anthropic._exceptions import RateLimitError
 from pydantic import BaseModel
-from functools import lru_cache
 import re
-import json
+import orjson
 import asyncio
+import hashlib
+import os
+from contextlib import aclosing
+from typing import AsyncGenerator
 
 # from app.services.claude_service import ClaudeService
 # from app.core.limiter import limiter
 
 load_dotenv()
 
-router = APIRouter(prefix="/generate", tags=["OpenAI o4-mini"])
+router = APIRouter(
+    prefix="/generate",
+    tags=["OpenAI o4-mini"],
+    default_response_class=ORJSONResponse,
+)
 
 # Initialize services
 # claude_service = ClaudeService()
 o4_service = OpenAIo4Service()
+# Reused across requests so the GitHub App installation token stays cached,
+# every service instance shares the pooled connections in http_client
+github_service = GitHubService()
+azure_service = AzureDevOpsService()
+
+# Caps in-flight o4-mini streams per worker to stay under upstream rate limits
+llm_semaphore = asyncio.Semaphore(int(os.getenv("LLM_CONCURRENCY", "16")))
+
+
+# cache repo data to avoid double API calls from cost and generate. Lookups are
+# single-flight, so a /stream issued while /cost is still fetching awaits the same
+# fetch, and a repo revisited within the TTL is served without any API calls
+repo_data_cache = AsyncTTLCache(ttl=10 * 60, maxsize=100)
+
+
+async def get_cached_repo_data(
+    provider: str,
+    username: str,
+    repo: str,
+    github_pat: str | None = None,
+    azure_pat: str | None = None,
+):
+    pat = azure_pat if provider == "azure" else github_pat
+    # Only a hash of the PAT is kept, so private repo data is never served to
+    # callers without a token while raw tokens stay out of the cache keys
+    pat_fingerprint = hashlib.sha256(pat.encode()).hexdigest() if pat else None
+    return await repo_data_cache.get_or_set(
+        (provider, username, repo, pat_fingerprint),
+        lambda: fetch_repo_data(provider, username, repo, github_pat, azure_pat),
+    )
 
 
-# cache repo data to avoid double API calls from cost and generate
-@lru_cache(maxsize=100)
-def get_cached_repo_data(
+async def fetch_repo_data(
     provider: str,
     username: str,
     repo: str,
@@ -39,18 +76,46 @@ def get_cached_repo_data(
     azure_pat: str | None = None,
 ):
     if provider == "azure":
-        service = AzureDevOpsService(pat=azure_pat)
+        service = AzureDevOpsService(pat=azure_pat) if azure_pat else azure_service
     else:
-        service = GitHubService(pat=github_pat)
+        service = GitHubService(pat=github_pat) if github_pat else github_service
+
+    branch_task = asyncio.create_task(service.get_default_branch(username, repo))
+
+    async def fetch_file_tree():
+        # Reuse the resolved branch instead of letting the service look it up again
+        return await service.get_repo_file_paths_as_list(
+            username, repo, branch=await branch_task
+        )
+
+    readme_task = asyncio.create_task(service.get_repo_readme(username, repo))
+    try:
+        default_branch, file_tree = await asyncio.gather(
+            branch_task, fetch_file_tree()
+        )
+        file_tree_tokens = await asyncio.to_thread(o4_service.count_tokens, file_tree)
+        # Reject oversized repos on the file tree alone, without waiting for the README
+        if file_tree_tokens > 195000:
+            raise ValueError(
+                f"Repository is too large (>195k tokens) for analysis. OpenAI o4-mini's max context length is 200k tokens. File tree size: {file_tree_tokens} tokens."
+            )
+        readme = await readme_task
+    finally:
+        readme_task.cancel()
 
-    default_branch = service.get_default_branch(username, repo)
     if not default_branch:
         default_branch = "main"  # fallback value
 
-    file_tree = service.get_repo_file_paths_as_list(username, repo)
-    readme = service.get_repo_readme(username, repo)
+    # Token counts are cached with the data so /cost and /stream don't re-tokenize
+    readme_tokens = await asyncio.to_thread(o4_service.count_tokens, readme)
 
-    return {"default_branch": default_branch, "file_tree": file_tree, "readme": readme}
+    return {
+        "default_branch": default_branch,
+        "file_tree": file_tree,
+        "readme": readme,
+        "file_tree_tokens": file_tree_tokens,
+        "readme_tokens": readme_tokens,
+    }
 
 
 class ApiRequest(BaseModel):
@@ -68,22 +133,15 @@ class ApiRequest(BaseModel):
 async def get_generation_cost(request: Request, body: ApiRequest):
     try:
         # Get file tree and README content
-        repo_data = get_cached_repo_data(
+        repo_data = await get_cached_repo_data(
             body.provider,
             body.username,
             body.repo,
             body.github_pat,
             body.azure_pat,
         )
-        file_tree = repo_data["file_tree"]
-        readme = repo_data["readme"]
-
-        # Calculate combined token count
-        # file_tree_tokens = claude_service.count_tokens(file_tree)
-        # readme_tokens = claude_service.count_tokens(readme)
-
-        file_tree_tokens = o4_service.count_tokens(file_tree)
-        readme_tokens = o4_service.count_tokens(readme)
+        file_tree_tokens = repo_data["file_tree_tokens"]
+        readme_tokens = repo_data["readme_tokens"]
 
         # CLAUDE: Calculate approximate cost
         # Input cost: $3 per 1M tokens ($0.000003 per token)
@@ -102,9 +160,61 @@ async def get_generation_cost(request: Request, body: ApiRequest):
 
         # Format as currency string
         cost_string = f"${estimated_cost:.2f} USD"
-        return {"cost": cost_string}
+        return ORJSONResponse({"cost": cost_string})
     except Exception as e:
-        return {"error": str(e)}
+        return ORJSONResponse({"error": str(e)})
+
+
+async def batch_chunks(
+    stream: AsyncGenerator[str, None], max_chunks: int = 8, max_delay: float = 0.05
+) -> AsyncGenerator[str, None]:
+    """
+    Coalesces chunks from an LLM stream so each SSE frame carries several of them.
+    A batch is flushed once it holds max_chunks chunks or max_delay seconds have
+    passed since the last flush.
+    """
+    loop = asyncio.get_running_loop()
+    buffer: list[str] = []
+    last_flush = loop.time()
+    # Close the upstream request too if the caller stops reading early
+    async with aclosing(stream):
+        async for chunk in stream:
+            buffer.append(chunk)
+            if len(buffer) >= max_chunks or loop.time() - last_flush > max_delay:
+                yield "".join(buffer)
+                buffer.clear()
+                last_flush = loop.time()
+    if buffer:
+        yield "".join(buffer)
+
+
+def _status_frame(status: str, message: str) -> bytes:
+    return ServerSentEvent(
+        orjson.dumps({"status": status, "message": message}).decode()
+    ).encode()
+
+
+# Fixed frames are encoded once, EventSourceResponse passes bytes through as-is
+STATUS_STARTED = _status_frame("started", "Starting generation process...")
+STATUS_EXPLANATION_SENT = _status_frame(
+    "explanation_sent", "Sending explanation request to o4-mini..."
+)
+STATUS_EXPLANATION = _status_frame("explanation", "Analyzing repository structure...")
+STATUS_MAPPING_SENT = _status_frame(
+    "mapping_sent", "Sending component mapping request to o4-mini..."
+)
+STATUS_MAPPING = _status_frame("mapping", "Creating component mapping...")
+STATUS_DIAGRAM_SENT = _status_frame(
+    "diagram_sent", "Sending diagram generation request to o4-mini..."
+)
+STATUS_DIAGRAM = _status_frame("diagram", "Generating diagram...")
+ERROR_BAD_INSTRUCTIONS = ServerSentEvent(
+    orjson.dumps({"error": "Invalid or unclear instructions provided"}).decode()
+).encode()
+
+
+# Match click events: click ComponentName "path/to/something"
+CLICK_RE = re.compile(r'click ([^\s"]+)\s+"([^"]+)"')
 
 
 def process_click_events(
@@ -120,7 +230,7 @@ def process_click_events(
         path = match.group(2).strip("\"'")
 
         # Determine if path is likely a file (has extension) or directory
-        is_file = "." in path.split("/")[-1]
+        is_file = "." in path[path.rfind("/") + 1 :]
 
         if provider == "azure":
             base = f"https://dev.azure.com/{username}/{repo}/_git/{repo}"
@@ -138,9 +248,7 @@ def process_click_events(
         # Return the full click event with the new URL
         return f'click {match.group(1)} "{full_url}"'
 
-    # Match click events: click ComponentName "path/to/something"
-    click_pattern = r'click ([^\s"]+)\s+"([^"]+)"'
-    return re.sub(click_pattern, replace_path, diagram)
+    return CLICK_RE.sub(replace_path, diagram)
 
 
 @router.post("/stream")
@@ -148,7 +256,9 @@ async def generate_stream(request: Request, body: ApiRequest):
     try:
         # Initial validation checks
         if len(body.instructions) > 1000:
-            return {"error": "Instructions exceed maximum length of 1000 characters"}
+            return ORJSONResponse(
+                {"error": "Instructions exceed maximum length of 1000 characters"}
+            )
 
         if body.repo in [
             "fastapi",
@@ -157,12 +267,12 @@ async def generate_stream(request: Request, body: ApiRequest):
             "api-analytics",
             "monkeytype",
         ]:
-            return {"error": "Example repos cannot be regenerated"}
+            return ORJSONResponse({"error": "Example repos cannot be regenerated"})
 
         async def event_generator():
             try:
                 # Get cached repository data
-                repo_data = get_cached_repo_data(
+                repo_data = await get_cached_repo_data(
                     body.provider,
                     body.username,
                     body.repo,
@@ -174,18 +284,17 @@ async def generate_stream(request: Request, body: ApiRequest):
                 readme = repo_data["readme"]
 
                 # Send initial status
-                yield f"data: {json.dumps({'status': 'started', 'message': 'Starting generation process...'})}\n\n"
-                await asyncio.sleep(0.1)
+                yield STATUS_STARTED
 
-                # Token count check
-                combined_content = f"{file_tree}\n{readme}"
-                token_count = o4_service.count_tokens(combined_content)
+                # Token count check, the sum is within a token or so of tokenizing
+                # the file tree and README joined together
+                token_count = repo_data["file_tree_tokens"] + repo_data["readme_tokens"]
 
                 if 50000 < token_count < 195000 and not body.api_key:
-                    yield f"data: {json.dumps({'error': f'File tree and README combined exceeds token limit (50,000). Current size: {token_count} tokens. This GitHub repository is too large for my wallet, but you can continue by providing your own OpenAI API key.'})}\n\n"
+                    yield {"data": orjson.dumps({'error': f'File tree and README combined exceeds token limit (50,000). Current size: {token_count} tokens. This GitHub repository is too large for my wallet, but you can continue by providing your own OpenAI API key.'}).decode()}
                     return
                 elif token_count > 195000:
-                    yield f"data: {json.dumps({'error': f'Repository is too large (>195k tokens) for analysis. OpenAI o4-mini\'s max context length is 200k tokens. Current size: {token_count} tokens.'})}\n\n"
+                    yield {"data": orjson.dumps({'error': f'Repository is too large (>195k tokens) for analysis. OpenAI o4-mini\'s max context length is 200k tokens. Current size: {token_count} tokens.'}).decode()}
                     return
 
                 # Prepare prompts
@@ -204,45 +313,62 @@ async def generate_stream(request: Request, body: ApiRequest):
                     )
 
                 # Phase 1: Get explanation
-                yield f"data: {json.dumps({'status': 'explanation_sent', 'message': 'Sending explanation request to o4-mini...'})}\n\n"
-                await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'explanation', 'message': 'Analyzing repository structure...'})}\n\n"
-                explanation = ""
-                async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=first_system_prompt,
-                    data={
-                        "file_tree": file_tree,
-                        "readme": readme,
-                        "instructions": body.instructions,
-                    },
-                    api_key=body.api_key,
-                    reasoning_effort="medium",
-                ):
-                    explanation += chunk
-                    yield f"data: {json.dumps({'status': 'explanation_chunk', 'chunk': chunk})}\n\n"
-
+                yield STATUS_EXPLANATION_SENT
+                yield STATUS_EXPLANATION
+                explanation_parts: list[str] = []
+                async with llm_semaphore:
+                    async for chunk in batch_chunks(
+                        o4_service.call_o4_api_stream(
+                            system_prompt=first_system_prompt,
+                            data={
+                                "file_tree": file_tree,
+                                "readme": readme,
+                                "instructions": body.instructions,
+                            },
+                            api_key=body.api_key,
+                            reasoning_effort="medium",
+                        )
+                    ):
+                        explanation_parts.append(chunk)
+                        yield {"data": orjson.dumps({'status': 'explanation_chunk', 'chunk': chunk}).decode()}
+
+                explanation = "".join(explanation_parts)
                 if "BAD_INSTRUCTIONS" in explanation:
-                    yield f"data: {json.dumps({'error': 'Invalid or unclear instructions provided'})}\n\n"
+                    yield ERROR_BAD_INSTRUCTIONS
                     return
 
                 # Phase 2: Get component mapping
-                yield f"data: {json.dumps({'status': 'mapping_sent', 'message': 'Sending component mapping request to o4-mini...'})}\n\n"
-                await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'mapping', 'message': 'Creating component mapping...'})}\n\n"
-                full_second_response = ""
-                async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=SYSTEM_SECOND_PROMPT,
-                    data={"explanation": explanation, "file_tree": file_tree},
-                    api_key=body.api_key,
-                    reasoning_effort="low",
-                ):
-                    full_second_response += chunk
-                    yield f"data: {json.dumps({'status': 'mapping_chunk', 'chunk': chunk})}\n\n"
-
-                # i dont think i need this anymore? but keep it here for now
-                # Extract component mapping
+                yield STATUS_MAPPING_SENT
+                yield STATUS_MAPPING
                 start_tag = "<component_mapping>"
                 end_tag = "</component_mapping>"
+                mapping_parts: list[str] = []
+                mapping_tail = ""
+                async with llm_semaphore:
+                    async with aclosing(
+                        batch_chunks(
+                            o4_service.call_o4_api_stream(
+                                system_prompt=SYSTEM_SECOND_PROMPT,
+                                data={"explanation": explanation, "file_tree": file_tree},
+                                api_key=body.api_key,
+                                reasoning_effort="low",
+                            )
+                        )
+                    ) as mapping_stream:
+                        async for chunk in mapping_stream:
+                            mapping_parts.append(chunk)
+                            yield {"data": orjson.dumps({'status': 'mapping_chunk', 'chunk': chunk}).decode()}
+                            # Phase 3 only needs the mapping, so start it as soon as the mapping is closed
+                            # instead of waiting for the rest of the response. Only the end of the
+                            # response so far is searched, in case the tag spans two chunks
+                            window = mapping_tail + chunk
+                            if end_tag in window:
+                                break
+                            mapping_tail = window[-len(end_tag) :]
+
+                full_second_response = "".join(mapping_parts)
+
+                # Extract component mapping
                 component_mapping_text = full_second_response[
                     full_second_response.find(start_tag) : full_second_response.find(
                         end_tag
@@ -250,30 +376,33 @@ async def generate_stream(request: Request, body: ApiRequest):
                 ]
 
                 # Phase 3: Generate Mermaid diagram
-                yield f"data: {json.dumps({'status': 'diagram_sent', 'message': 'Sending diagram generation request to o4-mini...'})}\n\n"
-                await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'diagram', 'message': 'Generating diagram...'})}\n\n"
-                mermaid_code = ""
-                async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=third_system_prompt,
-                    data={
-                        "explanation": explanation,
-                        "component_mapping": component_mapping_text,
-                        "instructions": body.instructions,
-                    },
-                    api_key=body.api_key,
-                    reasoning_effort="low",
-                ):
-                    mermaid_code += chunk
-                    yield f"data: {json.dumps({'status': 'diagram_chunk', 'chunk': chunk})}\n\n"
+                yield STATUS_DIAGRAM_SENT
+                yield STATUS_DIAGRAM
+                diagram_parts: list[str] = []
+                async with llm_semaphore:
+                    async for chunk in batch_chunks(
+                        o4_service.call_o4_api_stream(
+                            system_prompt=third_system_prompt,
+                            data={
+                                "explanation": explanation,
+                                "component_mapping": component_mapping_text,
+                                "instructions": body.instructions,
+                            },
+                            api_key=body.api_key,
+                            reasoning_effort="low",
+                        )
+                    ):
+                        diagram_parts.append(chunk)
+                        yield {"data": orjson.dumps({'status': 'diagram_chunk', 'chunk': chunk}).decode()}
 
                 # Process final diagram
-                mermaid_code = mermaid_code.replace("```mermaid", "").replace("```", "")
+                mermaid_code = "".join(diagram_parts).replace("```mermaid", "").replace("```", "")
                 if "BAD_INSTRUCTIONS" in mermaid_code:
-                    yield f"data: {json.dumps({'error': 'Invalid or unclear instructions provided'})}\n\n"
+                    yield ERROR_BAD_INSTRUCTIONS
                     return
 
-                processed_diagram = process_click_events(
+                processed_diagram = await asyncio.to_thread(
+                    process_click_events,
                     mermaid_code,
                     body.provider,
                     body.username,
@@ -282,24 +411,16 @@ async def generate_stream(request: Request, body: ApiRequest):
                 )
 
                 # Send final result
-                yield f"data: {json.dumps({
+                yield {"data": orjson.dumps({
                     'status': 'complete',
                     'diagram': processed_diagram,
                     'explanation': explanation,
                     'mapping': component_mapping_text
-                })}\n\n"
+                }).decode()}
 
             except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
-        return StreamingResponse(
-            event_generator(),
-            media_type="text/event-stream",
-            headers={
-                "X-Accel-Buffering": "no",  # Hint to Nginx
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            },
-        )
+                yield {"data": orjson.dumps({'error': str(e)}).decode()}
+
+        return EventSourceResponse(event_generator(), ping=15)
     except Exception as e:
-        return {"error": str(e)}
+        return ORJSONResponse({"error": str(e)})
@@ -1,30 +1,74 @@
-import requests
+import httpx
+import orjson
 import base64
+import re
 import os
 from dotenv import load_dotenv
+from app.core.http_client import http_client
 
 load_dotenv()
 
 
+EXCLUDED_PATTERNS = [
+    "node_modules/",
+    "vendor/",
+    "venv/",
+    ".min.",
+    ".pyc",
+    ".pyo",
+    ".pyd",
+    ".so",
+    ".dll",
+    ".class",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".ico",
+    ".svg",
+    ".ttf",
+    ".woff",
+    ".webp",
+    "__pycache__/",
+    ".cache/",
+    ".tmp/",
+    "yarn.lock",
+    "poetry.lock",
+    "*.log",
+    ".vscode/",
+    ".idea/",
+]
+# One alternation scans each path once instead of once per pattern
+_EXCLUDED_RE = re.compile("|".join(re.escape(pattern) for pattern in EXCLUDED_PATTERNS))
+
+
+def should_include_file(path: str) -> bool:
+    return _EXCLUDED_RE.search(path.lower()) is None
+
+
+def _get_headers(pat: str | None) -> dict[str, str]:
+    if not pat:
+        return {"Accept": "application/json"}
+    token = base64.b64encode(f":{pat}".encode()).decode()
+    return {
+        "Authorization": f"Basic {token}",
+        "Accept": "application/json",
+    }
+
+
 class AzureDevOpsService:
-    def __init__(self, pat: str | None = None):
+    def __init__(
+        self, pat: str | None = None, client: httpx.AsyncClient | None = None
+    ):
         self.azure_pat = pat or os.getenv("AZURE_PAT")
+        self.client = client or http_client
 
-    def _get_headers(self):
-        if not self.azure_pat:
-            return {"Accept": "application/json"}
-        token = base64.b64encode(f":{self.azure_pat}".encode()).decode()
-        return {
-            "Authorization": f"Basic {token}",
-            "Accept": "application/json",
-        }
-
-    def get_default_branch(self, organization: str, repo: str, project: str | None = None):
+    async def get_default_branch(self, organization: str, repo: str, project: str | None = None):
         project = project or repo
         api_url = (
             f"https://dev.azure.com/{organization}/{project}/_apis/git/repositories/{repo}?api-version=7.0"
         )
-        response = requests.get(api_url, headers=self._get_headers())
+        response = await self.client.get(api_url, headers=_get_headers(self.azure_pat))
         if response.status_code == 200:
             data = response.json()
             default_branch = data.get("defaultBranch")
@@ -32,65 +76,43 @@ class AzureDevOpsService:
                 return default_branch.replace("refs/heads/", "")
         return None
 
-    def get_repo_file_paths_as_list(self, organization: str, repo: str, project: str | None = None):
+    async def get_repo_file_paths_as_list(
+        self,
+        organization: str,
+        repo: str,
+        project: str | None = None,
+        branch: str | None = None,
+    ):
         project = project or repo
-        branch = self.get_default_branch(organization, repo, project) or "main"
+        branch = (
+            branch or await self.get_default_branch(organization, repo, project) or "main"
+        )
         api_url = (
             "https://dev.azure.com/"
             f"{organization}/{project}/_apis/git/repositories/{repo}/items"
             f"?recursionLevel=full&versionDescriptor.version={branch}&api-version=7.0"
         )
-        response = requests.get(api_url, headers=self._get_headers())
+        response = await self.client.get(api_url, headers=_get_headers(self.azure_pat))
         if response.status_code != 200:
             raise ValueError("Could not fetch repository file tree.")
-        data = response.json()
+        # The items listing can be tens of MB for large repos, orjson parses it much faster
+        data = orjson.loads(response.content)
 
-        def should_include_file(path: str) -> bool:
-            excluded_patterns = [
-                "node_modules/",
-                "vendor/",
-                "venv/",
-                ".min.",
-                ".pyc",
-                ".pyo",
-                ".pyd",
-                ".so",
-                ".dll",
-                ".class",
-                ".jpg",
-                ".jpeg",
-                ".png",
-                ".gif",
-                ".ico",
-                ".svg",
-                ".ttf",
-                ".woff",
-                ".webp",
-                "__pycache__/",
-                ".cache/",
-                ".tmp/",
-                "yarn.lock",
-                "poetry.lock",
-                "*.log",
-                ".vscode/",
-                ".idea/",
-            ]
-            return not any(pattern in path.lower() for pattern in excluded_patterns)
-
-        paths = [
-            item["path"].lstrip("/")
-            for item in data.get("value", [])
-            if item.get("gitObjectType") == "blob" and should_include_file(item["path"])
-        ]
-        return "\n".join(paths)
+        # Azure paths carry a single leading slash
+        return "\n".join(
+            path[1:] if path.startswith("/") else path
+            for item in data.get("value", ())
+            if item.get("gitObjectType") == "blob"
+            and should_include_file(path := item["path"])
+        )
 
-    def get_repo_readme(self, organization: str, repo: str, project: str | None = None):
+    async def get_repo_readme(self, organization: str, repo: str, project: str | None = None):
         project = project or repo
         api_url = (
             f"https://dev.azure.com/{organization}/{project}/_apis/git/repositories/{repo}/items"
             "?path=/README.md&includeContent=true&api-version=7.0"
         )
-        response = requests.get(api_url, headers=self._get_headers())
+        response = await self.client.get(api_url, headers=_get_headers(self.azure_pat))
         if response.status_code == 200:
             data = response.json()
             return data.get("content", "")